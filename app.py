@@ -9,7 +9,9 @@ import streamlit as st
 import openai
 import base64
 from pinecone import Pinecone
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+from sections import TOPICS, infer_topics, topic_label
 
 # Page configuration
 st.set_page_config(
@@ -285,9 +287,9 @@ if "pinecone_index" not in st.session_state:
     st.session_state.pinecone_index = None
 if "pending_prompt" not in st.session_state:
     st.session_state.pending_prompt = None
-if "chat_prompt" not in st.session_state:
-    # Used as the widget key for st.chat_input so we can prefill from example questions.
-    st.session_state.chat_prompt = ""
+if "topic_filter" not in st.session_state:
+    # Topic keys chosen in the sidebar; empty means infer from the question
+    st.session_state.topic_filter = []
 
 def init_pinecone():
     """Initialize Pinecone connection."""
@@ -311,51 +313,135 @@ def get_embedding(text: str) -> List[float]:
     )
     return response.data[0].embedding
 
-def search_knowledge_base(query: str, index, top_k: int = 8) -> List[dict]:
-    """Search Pinecone for relevant documents."""
+def build_filter(topics: Optional[List[str]] = None, documents: Optional[List[str]] = None,
+                 sections: Optional[List[str]] = None) -> Optional[dict]:
+    """Build a Pinecone metadata filter scoping a search to topics, sections and/or documents.
+
+    A section matches any heading in a chunk's section_path, so naming a chapter
+    also selects its subsections.
+    """
+    clauses = []
+    if topics:
+        clauses.append({"topics": {"$in": list(topics)}})
+    if sections:
+        clauses.append({"section_path": {"$in": list(sections)}})
+    if documents:
+        clauses.append({"document": {"$in": list(documents)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+# Retrieval thresholds. MIN_SCORE is both the relevance bar for context and the
+# answer/no-answer bar: when no match clears it, the LLM is not called.
+MIN_SCORE = 0.35
+MAX_GAP = 0.1
+
+def select_matches(matches: List[dict], min_score: float = MIN_SCORE, max_gap: float = MAX_GAP,
+                   mass: float = 0.9, min_k: int = 2) -> List[dict]:
+    """Pick how many matches to keep from the score distribution.
+
+    Matches below min_score are dropped, the list is cut at the first score drop of
+    at least max_gap, and then trimmed once the kept matches hold `mass` of the total
+    score above min_score. Neither cut keeps fewer than min_k matches that cleared
+    min_score. Returns [] when nothing clears the bar.
+    """
+    ranked = sorted(matches, key=lambda m: float(m.score or 0.0), reverse=True)
+    kept = [m for m in ranked if float(m.score or 0.0) >= min_score]
+    if not kept:
+        return []
+
+    # Gap detection: a sharp drop separates the answer from loosely related chunks
+    for i in range(1, len(kept)):
+        if float(kept[i - 1].score or 0.0) - float(kept[i].score or 0.0) >= max_gap:
+            kept = kept[:max(i, min_k)]
+            break
+
+    # Cumulative score mass: stop once the tail adds little beyond the bar
+    margins = [float(m.score or 0.0) - min_score for m in kept]
+    total = sum(margins)
+    if total > 0:
+        running = 0.0
+        for i, margin in enumerate(margins):
+            running += margin
+            if running >= mass * total:
+                kept = kept[:max(i + 1, min_k)]
+                break
+
+    return kept
+
+def search_knowledge_base(query: str, index, top_k: int = 12,
+                          topics: Optional[List[str]] = None,
+                          documents: Optional[List[str]] = None,
+                          sections: Optional[List[str]] = None,
+                          infer: bool = False) -> List[dict]:
+    """Search Pinecone for relevant documents, optionally scoped to topics/sections/documents.
+
+    Fetches top_k candidates in one query; build_context decides how many to use.
+    With infer=True and no explicit topics or sections, topics are guessed from the
+    query. A guessed filter is soft: if its best match is weak (below MIN_SCORE +
+    MAX_GAP) the unfiltered results are merged in. An explicit topic or section
+    filter that matches nothing (e.g. an index built before section tagging) falls
+    back to searching the selected documents unscoped.
+    """
     query_embedding = get_embedding(query)
     
-    results = index.query(
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True
-    )
+    inferred = False
+    if not topics and not sections and infer:
+        topics = infer_topics(query)
+        inferred = bool(topics)
+    
+    def run_query(flt: Optional[dict]) -> List[dict]:
+        return index.query(
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter=flt
+        ).matches
+    
+    matches = run_query(build_filter(topics, documents, sections))
+    if not topics and not sections:
+        return matches
+    
+    best = max((float(m.score or 0.0) for m in matches), default=0.0)
+    if inferred and best < MIN_SCORE + MAX_GAP:
+        # A guessed topic should never hide a better answer elsewhere in the manual
+        merged = {m.id: m for m in run_query(build_filter(None, documents))}
+        merged.update({m.id: m for m in matches})
+        matches = sorted(merged.values(), key=lambda m: float(m.score or 0.0), reverse=True)[:top_k]
+    elif not matches:
+        matches = run_query(build_filter(None, documents))
     
-    return results.matches
+    return matches
 
-def build_context(matches: List[dict], min_score: float = 0.35) -> Tuple[str, List[dict]]:
-    """Build context string from search results."""
+def build_context(matches: List[dict], min_score: float = MIN_SCORE) -> Tuple[str, List[dict]]:
+    """Build context string from search results.
+
+    Returns an empty context when nothing clears min_score, so the caller can
+    answer without an LLM call.
+    """
     context_parts = []
     sources = []
     
-    # Include all sufficiently relevant matches
-    for match in matches:
-        if (match.score or 0.0) >= min_score:
-            text = (match.metadata or {}).get("text", "") or ""
-            page = (match.metadata or {}).get("page", 0) or 0
-            context_parts.append(text)
-            sources.append({
-                "text": text[:200] + "..." if len(text) > 200 else text,
-                "page": int(page) + 1,  # Convert to 1-indexed
-                "score": round(float(match.score or 0.0), 3)
-            })
-
-    # If nothing met the threshold but we have matches, use the best few anyway.
-    if not context_parts and matches:
-        best = sorted(matches, key=lambda m: float(m.score or 0.0), reverse=True)[:3]
-        for match in best:
-            text = (match.metadata or {}).get("text", "") or ""
-            page = (match.metadata or {}).get("page", 0) or 0
-            if text:
-                context_parts.append(text)
-                sources.append({
-                    "text": text[:200] + "..." if len(text) > 200 else text,
-                    "page": int(page) + 1,
-                    "score": round(float(match.score or 0.0), 3)
-                })
+    for match in select_matches(matches, min_score):
+        text = (match.metadata or {}).get("text", "") or ""
+        page = (match.metadata or {}).get("page", 0) or 0
+        if not text:
+            continue
+        context_parts.append(text)
+        sources.append({
+            "text": text[:200] + "..." if len(text) > 200 else text,
+            "page": int(page) + 1,  # Convert to 1-indexed
+            "section": (match.metadata or {}).get("section", "") or "",
+            "score": round(float(match.score or 0.0), 3)
+        })
     
     return "\n\n".join(context_parts), sources
 
+def format_section(source: dict) -> str:
+    """Section label shown next to a source's page number (older messages have none)."""
+    section = source.get("section")
+    return f" &middot; {section}" if section else ""
+
 def get_chat_response(query: str, context: str, chat_history: List[dict]) -> str:
     """Get response from OpenAI using RAG context."""
     client = openai.OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
@@ -442,6 +528,14 @@ def main():
         - Troubleshooting
         """)
         
+        st.multiselect(
+            "Limit search to topics",
+            options=list(TOPICS),
+            format_func=topic_label,
+            key="topic_filter",
+            help="Leave empty to pick topics automatically from each question."
+        )
+        
         st.markdown("---")
         st.markdown("### Quick References")
         st.markdown("""
@@ -471,7 +565,7 @@ def main():
                     for source in message["sources"]:
                         st.markdown(f"""
                         <div class="source-box">
-                            <strong>Page {source['page']}</strong> (Relevance: {source['score']})
+                            <strong>Page {source['page']}</strong>{format_section(source)} (Relevance: {source['score']})
                             <br><em>{source['text']}</em>
                         </div>
                         """, unsafe_allow_html=True)
@@ -491,10 +585,15 @@ def main():
         with st.chat_message("assistant"):
             with st.spinner("Searching manual and generating response..."):
                 # Search knowledge base
-                matches = search_knowledge_base(prompt, index)
+                matches = search_knowledge_base(
+                    prompt, index,
+                    topics=st.session_state.topic_filter,
+                    infer=True
+                )
                 context, sources = build_context(matches)
 
                 if not context:
+                    # Nothing relevant enough: skip the LLM call entirely
                     response = """I couldn't find specific information about that in the Running Floor II 
                     Installation Manual. Could you rephrase your question, or ask about:
                     - Trailer preparation and alignment
@@ -518,7 +617,7 @@ def main():
                         for source in sources:
                             st.markdown(f"""
                             <div class="source-box">
-                                <strong>Page {source['page']}</strong> (Relevance: {source['score']})
+                                <strong>Page {source['page']}</strong>{format_section(source)} (Relevance: {source['score']})
                                 <br><em>{source['text']}</em>
                             </div>
                             """, unsafe_allow_html=True)
@@ -530,17 +629,15 @@ def main():
             "sources": sources
         })
 
-        # Clear the draft in the input after sending
-        st.session_state.chat_prompt = ""
-
     # If an example question was clicked, treat it like a submitted prompt.
     if st.session_state.pending_prompt:
         pending = st.session_state.pending_prompt
         st.session_state.pending_prompt = None
         handle_prompt(pending)
 
-    # Chat input (keyed so we can prefill from example questions)
-    if prompt := st.chat_input("Ask a question about the Running Floor II installation...", key="chat_prompt"):
+    # Chat input (st.chat_input values can't be set from session state, so examples
+    # go through pending_prompt instead of prefilling the box)
+    if prompt := st.chat_input("Ask a question about the Running Floor II installation..."):
         handle_prompt(prompt)
 
 # Example questions section
@@ -559,8 +656,7 @@ def show_example_questions():
     for i, example in enumerate(examples):
         with cols[i % 2]:
             if st.button(f"❓ {example}", key=f"example_{i}", type="secondary"):
-                # Prefill the question box and immediately ask it.
-                st.session_state.chat_prompt = example
+                # Ask it immediately on the rerun.
                 st.session_state.pending_prompt = example
                 st.rerun()
 
@@ -6,14 +6,19 @@ Run this once to populate your Pinecone index:
     python ingest.py
 """
 
+import bisect
 import os
+import re
 from dotenv import load_dotenv
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 import openai
 from pinecone import Pinecone
+from pypdf import PdfReader
 import tiktoken
 
+from sections import classify_topics
+
 # Load environment variables
 load_dotenv()
 
@@ -42,17 +47,146 @@ def load_and_split_pdf(pdf_path: str, chunk_size: int = 500, chunk_overlap: int
     
     print(f"Loaded {len(documents)} pages")
     
+    # Record where the manual's section hierarchy changes
+    section_marks = extract_sections(pdf_path, documents)
+    
     # Split documents into chunks
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]
+        separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True  # Lets each chunk find the heading in effect where it starts
     )
     
     chunks = text_splitter.split_documents(documents)
     print(f"Created {len(chunks)} chunks")
     
+    document = os.path.splitext(os.path.basename(pdf_path))[0]
+    tag_chunks(chunks, section_marks, document)
+    
+    return chunks
+
+def flatten_outline(reader: PdfReader, outline, level: int = 0) -> list[tuple[int, str, int]]:
+    """Flatten a nested PDF outline into (level, title, page) entries."""
+    entries = []
+    for item in outline:
+        if isinstance(item, list):
+            # A nested list holds the children of the preceding entry
+            entries.extend(flatten_outline(reader, item, level + 1))
+            continue
+        try:
+            page = reader.get_destination_page_number(item)
+        except Exception:
+            continue
+        title = " ".join(str(item.title or "").split())
+        if title and page is not None and page >= 0:
+            entries.append((level, title, page))
+    return entries
+
+# Fallback for PDFs without bookmarks: short ALL-CAPS lines are treated as headings
+HEADING_PATTERN = re.compile(r"^[A-Z0-9][A-Z0-9 &/,\-()]{3,58}[A-Z0-9)]$")
+NOT_HEADINGS = ("WARNING", "CAUTION", "DANGER", "NOTE", "IMPORTANT")
+# Lines on more than this share of pages are running headers/footers, not headings
+MAX_HEADING_PAGE_SHARE = 0.1
+
+def find_text_headings(documents) -> list[tuple[int, str, int, int]]:
+    """Detect top-level headings from page text when the PDF has no outline.
+
+    Returns (level, title, page, offset) entries, offset being the heading's
+    character position in the page text.
+    """
+    page_lines = []
+    line_pages: dict[str, int] = {}
+    for doc in documents:
+        lines = []
+        offset = 0
+        for raw in doc.page_content.splitlines(keepends=True):
+            lines.append((" ".join(raw.split()), offset))
+            offset += len(raw)
+        page_lines.append((doc.metadata.get("page", 0), lines))
+        # Page numbers differ on every page, so compare lines with digits masked
+        for key in {re.sub(r"\d+", "#", line) for line, _ in lines}:
+            line_pages[key] = line_pages.get(key, 0) + 1
+
+    max_pages = max(2, int(len(documents) * MAX_HEADING_PAGE_SHARE))
+    entries = []
+    for page, lines in page_lines:
+        for line, offset in lines:
+            if (len(line.split()) >= 2 and HEADING_PATTERN.match(line)
+                    and not line.startswith(NOT_HEADINGS)
+                    and line_pages[re.sub(r"\d+", "#", line)] <= max_pages):
+                entries.append((0, line.title(), page, offset))
+    return entries
+
+def locate_outline_entries(entries: list[tuple[int, str, int]], documents) -> list[tuple[int, str, int, int]]:
+    """Find where each outline title appears in its page text.
+
+    Titles that can't be found are placed just after the previous heading on the
+    same page (or at the top of the page) so outline order is preserved.
+    """
+    page_text = {doc.metadata.get("page", 0): doc.page_content for doc in documents}
+    last_offset: dict[int, int] = {}
+    located = []
+    for level, title, page in entries:
+        start = last_offset.get(page, 0)
+        pattern = r"\s+".join(re.escape(word) for word in title.split())
+        match = re.compile(pattern, re.IGNORECASE).search(page_text.get(page, ""), start)
+        offset = match.start() if match else start
+        last_offset[page] = offset
+        located.append((level, title, page, offset))
+    return located
+
+def extract_sections(pdf_path: str, documents) -> list[tuple[tuple[int, int], list[str]]]:
+    """List the points where the section hierarchy changes.
+
+    Each mark is ((page, offset), section path outermost first) and applies from
+    that position in the page text until the next mark.
+    """
+    entries = []
+    try:
+        reader = PdfReader(pdf_path)
+        entries = locate_outline_entries(flatten_outline(reader, reader.outline), documents)
+    except Exception as e:
+        print(f"Could not read PDF outline: {e}")
+
+    if entries:
+        print(f"Found {len(entries)} outline entries")
+    else:
+        entries = find_text_headings(documents)
+        print(f"No PDF outline; detected {len(entries)} headings from page text")
+
+    # Outline order is reading order; a stable sort keeps ties in sequence
+    entries.sort(key=lambda entry: (entry[2], entry[3]))
+
+    section_marks = []
+    path: list[str] = []
+    for level, title, page, offset in entries:
+        path = path[:level] + [title]
+        section_marks.append(((page, offset), list(path)))
+
+    return section_marks
+
+def section_at(section_marks: list[tuple[tuple[int, int], list[str]]], page: int, offset: int) -> list[str]:
+    """Section path in effect at a character offset of a page."""
+    i = bisect.bisect_right([position for position, _ in section_marks], (page, offset))
+    return section_marks[i - 1][1] if i else []
+
+def tag_chunks(chunks, section_marks: list[tuple[tuple[int, int], list[str]]], document: str):
+    """Attach document, section hierarchy and topic metadata to each chunk."""
+    for chunk in chunks:
+        # start_index comes from the splitter's add_start_index=True
+        section_path = section_at(section_marks, chunk.metadata.get("page", 0),
+                                  chunk.metadata.get("start_index", 0))
+        # Headings name the section's subject, but a passage (e.g. hose routing under a
+        # drive unit heading) can cover more, so tag the union of both
+        heading_topics = classify_topics(" ".join(section_path))
+        text_topics = classify_topics(chunk.page_content)
+        topics = heading_topics + [t for t in text_topics if t not in heading_topics]
+        chunk.metadata["document"] = document
+        chunk.metadata["section"] = section_path[-1] if section_path else ""
+        chunk.metadata["section_path"] = section_path
+        chunk.metadata["topics"] = topics
     return chunks
 
 def create_embeddings(texts: list[str]) -> list[list[float]]:
@@ -86,14 +220,22 @@ def upload_to_pinecone(chunks, embeddings, index_name: str):
     # Prepare vectors for upsert
     vectors = []
     for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        metadata = {
+            "text": chunk.page_content,
+            "page": chunk.metadata.get("page", 0),
+            "source": chunk.metadata.get("source", "unknown"),
+            "document": chunk.metadata.get("document", "unknown"),
+            "section": chunk.metadata.get("section", "")
+        }
+        # search_knowledge_base filters on these string lists with $in; skip empty ones
+        for key in ("section_path", "topics"):
+            if chunk.metadata.get(key):
+                metadata[key] = chunk.metadata[key]
         vectors.append({
-            "id": f"chunk_{i}",
+            # Prefix with the document so a second manual doesn't overwrite the first
+            "id": f"{chunk.metadata.get('document', 'unknown')}_chunk_{i}",
             "values": embedding,
-            "metadata": {
-                "text": chunk.page_content,
-                "page": chunk.metadata.get("page", 0),
-                "source": chunk.metadata.get("source", "unknown")
-            }
+            "metadata": metadata
         })
     
     # Upsert in batches
@@ -0,0 +1,487 @@
+"""
+KEITH Running Floor II - Concurrent Load Test
+Simulates many Streamlit sessions asking questions against one app.py process
+
+Each simulated technician gets its own Streamlit ScriptRunner, exactly like a
+browser tab served by `streamlit run app.py`, so the full script rerun
+(CSS, sidebar, chat history, handle_prompt) is exercised. OpenAI and Pinecone
+are replaced by local stand-ins with configurable latency, so no API keys
+are needed and no usage is billed.
+
+The harness drives Streamlit's internal ScriptRunner directly, so it only
+supports the Streamlit versions listed in SUPPORTED_STREAMLIT.
+
+Run from the project directory:
+    python loadtest.py
+    python loadtest.py --concurrency 1,4,16,32 --questions 5 --chat-ms 2500
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest.mock import MagicMock
+
+import openai
+import pinecone
+import streamlit as st
+
+# ScriptRunner's constructor changed in 1.33 (fragment_storage) and the module
+# moved in 1.37; check before importing internals so the failure is readable.
+SUPPORTED_STREAMLIT = ((1, 28), (1, 33))
+_streamlit_version = tuple(int(part) for part in st.__version__.split(".")[:2])
+if not SUPPORTED_STREAMLIT[0] <= _streamlit_version < SUPPORTED_STREAMLIT[1]:
+    sys.exit(f"loadtest.py supports streamlit >=1.28,<1.33 (found {st.__version__}); "
+             f"install the version pinned in requirements.txt.")
+
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.memory_uploaded_file_manager import MemoryUploadedFileManager
+from streamlit.runtime.scriptrunner import RerunData, ScriptRunner, ScriptRunnerEvent
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.scriptrunner.script_run_context import get_script_run_ctx
+from streamlit.runtime.secrets import Secrets
+from streamlit.runtime.state.session_state import SessionState
+
+APP_DIR = Path(__file__).resolve().parent
+APP_SCRIPT = APP_DIR / "app.py"
+
+QUESTIONS = [
+    "How do I align the drive unit in a center frame trailer?",
+    "What are the steps for installing floor seals?",
+    "How should I route hydraulic tubing?",
+    "What's the recommended torque for floor bolts?",
+    "How do I prepare the trailer before installation?",
+    "What's the minimum drive gap needed?",
+    "How do I install the sub-deck crossmembers?",
+    "What hydraulic oil should I use?",
+]
+
+STANDIN_TEXT = (
+    "Stand-in manual excerpt used for load testing. Position the drive unit, "
+    "check alignment against the trailer centerline, and torque fasteners to "
+    "the values listed in the specification table before proceeding. "
+) * 3
+
+
+class Upstream:
+    """Latency model and per-session call accounting shared by the stand-ins."""
+
+    def __init__(self, embed_ms: float, query_ms: float, chat_ms: float,
+                 jitter: float, off_topic_rate: float, seed: Optional[int] = None):
+        self.latency_ms = {"embed": embed_ms, "query": query_ms, "chat": chat_ms}
+        self.jitter = jitter
+        self.off_topic_rate = off_topic_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._traces: Dict[str, dict] = {}
+
+    def begin(self, session_id: str) -> None:
+        """Reset the trace for a session's next question."""
+        with self._lock:
+            self._traces[session_id] = {"first_call": None, "upstream_s": 0.0, "calls": {}}
+
+    def trace(self, session_id: str) -> dict:
+        with self._lock:
+            return dict(self._traces.get(session_id) or {})
+
+    def random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def call(self, kind: str) -> None:
+        """Block the calling script thread like a real network round trip."""
+        base = self.latency_ms[kind] / 1000.0
+        with self._lock:
+            delay = max(0.0, base * (1.0 + self._rng.uniform(-self.jitter, self.jitter)))
+        ctx = get_script_run_ctx()
+        started = time.perf_counter()
+        time.sleep(delay)
+        if ctx is None:
+            return
+        with self._lock:
+            trace = self._traces.get(ctx.session_id)
+            if trace is not None:
+                if trace["first_call"] is None:
+                    trace["first_call"] = started
+                trace["upstream_s"] += time.perf_counter() - started
+                trace["calls"][kind] = trace["calls"].get(kind, 0) + 1
+
+
+class StandInOpenAI:
+    """Drop-in for `openai.OpenAI` covering the embeddings and chat calls app.py makes."""
+
+    upstream: Upstream = None
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        self._upstream = self.upstream
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def _create_embedding(self, model: str, input, dimensions: int = 1536, **kwargs):
+        self._upstream.call("embed")
+        inputs = input if isinstance(input, list) else [input]
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.0] * dimensions) for _ in inputs])
+
+    def _create_completion(self, model: str, messages: List[dict], **kwargs):
+        self._upstream.call("chat")
+        content = "Stand-in answer: follow the procedure described in the referenced pages."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StandInIndex:
+    """Drop-in for a Pinecone index returning synthetic, score-ordered matches."""
+
+    def __init__(self, upstream: Upstream):
+        self._upstream = upstream
+
+    def query(self, vector: List[float], top_k: int = 8, include_metadata: bool = True,
+              filter: Optional[dict] = None, **kwargs):
+        self._upstream.call("query")
+        off_topic = self._upstream.random() < self._upstream.off_topic_rate
+        top = 0.25 if off_topic else 0.55 + 0.25 * self._upstream.random()
+        matches = []
+        for rank in range(top_k):
+            score = max(0.0, top - 0.04 * rank - 0.02 * self._upstream.random())
+            matches.append(SimpleNamespace(
+                id=f"chunk_{rank}",
+                score=score,
+                metadata={"text": STANDIN_TEXT, "page": rank, "source": "loadtest"},
+            ))
+        return SimpleNamespace(matches=matches)
+
+
+class StandInPinecone:
+    """Drop-in for `pinecone.Pinecone`."""
+
+    upstream: Upstream = None
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        self._upstream = self.upstream
+
+    def Index(self, name: str):
+        return StandInIndex(self._upstream)
+
+
+def install_standins(upstream: Upstream) -> None:
+    """Point app.py's OpenAI/Pinecone clients, secrets and runtime at local fakes."""
+    StandInOpenAI.upstream = upstream
+    StandInPinecone.upstream = upstream
+    openai.OpenAI = StandInOpenAI
+    # app.py re-imports `Pinecone` from the module on every script rerun.
+    pinecone.Pinecone = StandInPinecone
+
+    secrets = Secrets([])
+    secrets._secrets = {
+        "OPENAI_API_KEY": "loadtest",
+        "PINECONE_API_KEY": "loadtest",
+        "PINECONE_INDEX": "loadtest",
+    }
+    st.secrets = secrets
+
+    # One shared runtime, as in a single `streamlit run` process.
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    # Seeding pending_prompt from a worker thread warns about a missing
+    # ScriptRunContext on every question; that is expected here. A filter is used
+    # because Streamlit resets its loggers' levels when it reads config.
+    logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage()
+    )
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, if the platform exposes it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux.
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class SimulatedSession:
+    """One browser tab: its own SessionState, a new ScriptRunner per rerun."""
+
+    def __init__(self, session_id: str, upstream: Upstream, script_cache: ScriptCache,
+                 timeout: float):
+        self.session_id = session_id
+        self.session_state = SessionState()
+        self._upstream = upstream
+        self._script_cache = script_cache
+        self._uploaded_file_mgr = MemoryUploadedFileManager("/mock/upload")
+        self._timeout = timeout
+        # Cleared when a timed-out runner would not stop; the session is then abandoned
+        # rather than starting a second runner on the same SessionState.
+        self.alive = True
+
+    def _rerun(self) -> Optional[str]:
+        """Run the app script once, mirroring AppSession.
+
+        Returns None on success, otherwise a description of why the run failed
+        (an exception rendered by the script, a compile error, or a timeout).
+        """
+        done = threading.Event()
+        errors: List[str] = []
+
+        def on_event(sender, event, **kwargs):
+            if event == ScriptRunnerEvent.ENQUEUE_FORWARD_MSG:
+                msg = kwargs.get("forward_msg")
+                # Uncaught app exceptions reach the browser as an `exception` element
+                if (msg is not None and msg.HasField("delta")
+                        and msg.delta.HasField("new_element")
+                        and msg.delta.new_element.HasField("exception")):
+                    exc = msg.delta.new_element.exception
+                    errors.append(f"{exc.type}: {' '.join(exc.message.split())}")
+            elif event == ScriptRunnerEvent.SCRIPT_STOPPED_WITH_COMPILE_ERROR:
+                errors.append(f"Compile error: {kwargs.get('exception')}")
+            elif event == ScriptRunnerEvent.SHUTDOWN:
+                done.set()
+
+        runner = ScriptRunner(
+            session_id=self.session_id,
+            main_script_path=str(APP_SCRIPT),
+            session_state=self.session_state,
+            uploaded_file_mgr=self._uploaded_file_mgr,
+            script_cache=self._script_cache,
+            initial_rerun_data=RerunData(),
+            user_info={"email": "loadtest@example.com"},
+        )
+        runner.on_event.connect(on_event, weak=False)
+        runner.start()
+        if not done.wait(self._timeout):
+            runner.request_stop()
+            if not done.wait(self._timeout):
+                self.alive = False
+            return f"Timed out after {self._timeout:g}s"
+        return errors[0] if errors else None
+
+    def open(self) -> Optional[str]:
+        """Initial page load, before any question is asked."""
+        return self._rerun()
+
+    def ask(self, question: str) -> dict:
+        """Submit a question the way an example-question click does and time it."""
+        before = len(self.session_state["messages"]) if "messages" in self.session_state else 0
+        self._upstream.begin(self.session_id)
+        self.session_state["pending_prompt"] = question
+
+        submitted = time.perf_counter()
+        error = self._rerun()
+        finished = time.perf_counter()
+
+        trace = self._upstream.trace(self.session_id)
+        after = len(self.session_state["messages"]) if "messages" in self.session_state else 0
+        first_call = trace.get("first_call")
+        if error is None and after != before + 2:
+            error = "Question was not answered (chat history unchanged)"
+        return {
+            "ok": error is None,
+            "error": error,
+            "latency_s": finished - submitted,
+            "queue_s": (first_call - submitted) if first_call else None,
+            "upstream_s": trace.get("upstream_s", 0.0),
+            "calls": trace.get("calls", {}),
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_level(concurrency: int, questions: int, upstream: Upstream, timeout: float,
+              think_ms: float, rss_baseline: Optional[int]) -> dict:
+    """Drive `concurrency` sessions, each asking `questions` questions back to back."""
+    # Release the previous level's sessions so they are not billed to this one
+    gc.collect()
+    rss_before = rss_bytes()
+
+    script_cache = ScriptCache()
+    sessions = [
+        SimulatedSession(f"loadtest-{concurrency}-{i}", upstream, script_cache, timeout)
+        for i in range(concurrency)
+    ]
+    failures: Counter = Counter()
+    for session in sessions:
+        error = session.open()
+        if error:
+            failures[f"page load: {error}"] += 1
+
+    results: List[dict] = []
+    results_lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+
+    def worker(session: SimulatedSession, offset: int) -> None:
+        start_barrier.wait()
+        for q in range(questions):
+            if not session.alive:
+                break
+            result = session.ask(QUESTIONS[(offset + q) % len(QUESTIONS)])
+            with results_lock:
+                results.append(result)
+            if think_ms:
+                time.sleep(think_ms / 1000.0)
+
+    threads = [
+        threading.Thread(target=worker, args=(session, i), daemon=True)
+        for i, session in enumerate(sessions)
+    ]
+    for t in threads:
+        t.start()
+
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency_s"] for r in ok]
+    queues = [r["queue_s"] for r in ok if r["queue_s"] is not None]
+    overheads = [r["latency_s"] - r["upstream_s"] for r in ok]
+    chat_calls = sum(r["calls"].get("chat", 0) for r in ok)
+    failures.update(r["error"] for r in results if not r["ok"])
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "answered": len(ok),
+        "errors": len(results) - len(ok),
+        "wall_s": wall_s,
+        "throughput_rps": len(ok) / wall_s if wall_s else 0.0,
+        "queue_p50_ms": percentile(queues, 50) * 1000,
+        "queue_p95_ms": percentile(queues, 95) * 1000,
+        "latency_mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "latency_max_ms": max(latencies) * 1000 if latencies else float("nan"),
+        "upstream_p50_ms": percentile([r["upstream_s"] for r in ok], 50) * 1000,
+        "overhead_p95_ms": percentile(overheads, 95) * 1000,
+        "chat_calls": chat_calls,
+        "rss_before_mb": rss_before / 2**20 if rss_before else None,
+        "rss_after_mb": rss_after / 2**20 if rss_after else None,
+        "rss_growth_mb": (rss_after - rss_baseline) / 2**20 if rss_baseline and rss_after else None,
+        "rss_per_session_kb": ((rss_after - rss_before) / 1024 / concurrency
+                               if rss_before and rss_after else None),
+        "abandoned_sessions": sum(1 for session in sessions if not session.alive),
+        "failures": dict(failures.most_common()),
+    }
+
+
+def print_report(levels: List[dict], upstream: Upstream) -> None:
+    lat = upstream.latency_ms
+    print(f"\nStand-in latency: embed {lat['embed']:.0f} ms, query {lat['query']:.0f} ms, "
+          f"chat {lat['chat']:.0f} ms (±{upstream.jitter:.0%})")
+    header = (f"{'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>7} {'queue p50':>10} {'queue p95':>10} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'ovh p95':>8} "
+              f"{'LLM %':>6} {'RSS MB':>8} {'+RSS MB':>8} {'KB/sess':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in levels:
+        rss = f"{r['rss_after_mb']:.1f}" if r["rss_after_mb"] is not None else "n/a"
+        growth = f"{r['rss_growth_mb']:.1f}" if r["rss_growth_mb"] is not None else "n/a"
+        per = f"{r['rss_per_session_kb']:.0f}" if r["rss_per_session_kb"] is not None else "n/a"
+        llm = 100.0 * r["chat_calls"] / r["answered"] if r["answered"] else 0.0
+        print(f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>7.2f} "
+              f"{r['queue_p50_ms']:>10.1f} {r['queue_p95_ms']:>10.1f} {r['latency_p50_ms']:>8.0f} "
+              f"{r['latency_p95_ms']:>8.0f} {r['latency_p99_ms']:>8.0f} {r['latency_max_ms']:>8.0f} "
+              f"{r['overhead_p95_ms']:>8.0f} {llm:>6.0f} {rss:>8} {growth:>8} {per:>8}")
+    print("\nqueue = question submitted -> first upstream call (script rerun + contention)")
+    print("ovh   = end-to-end latency minus time spent waiting on stand-in upstreams")
+    print("LLM % = answered questions that needed a chat completion (the rest exited early)")
+    print("+RSS  = RSS growth since before the first level; KB/sess = growth during this level per session")
+
+    failed = [r for r in levels if r["failures"] or r["abandoned_sessions"]]
+    if failed:
+        print("\nFAILURES (latency and throughput only count successful questions):")
+        for r in failed:
+            print(f"  {r['concurrency']} session(s):")
+            if r["abandoned_sessions"]:
+                print(f"    {r['abandoned_sessions']} session(s) abandoned after a runner would not stop")
+            for error, count in r["failures"].items():
+                print(f"    {count:>4} x {error}")
+
+
+def main():
+    """Ramp concurrency and report how one app.py process scales."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--concurrency", default="1,2,4,8,16",
+                        help="comma-separated session counts to ramp through")
+    parser.add_argument("--questions", type=int, default=3, help="questions asked per session")
+    parser.add_argument("--embed-ms", type=float, default=150.0, help="stand-in embedding latency")
+    parser.add_argument("--query-ms", type=float, default=80.0, help="stand-in Pinecone query latency")
+    parser.add_argument("--chat-ms", type=float, default=1500.0, help="stand-in chat completion latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± fraction applied to each latency")
+    parser.add_argument("--off-topic-rate", type=float, default=0.0,
+                        help="fraction of questions whose matches all score low")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a session's questions")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-question timeout in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="seed for latency jitter")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    if not APP_SCRIPT.exists():
+        print(f"Error: app not found at {APP_SCRIPT}")
+        return
+
+    # app.py loads brand/ and assets/ relative to the working directory.
+    os.chdir(APP_DIR)
+
+    upstream = Upstream(args.embed_ms, args.query_ms, args.chat_ms,
+                        args.jitter, args.off_topic_rate, args.seed)
+    install_standins(upstream)
+
+    gc.collect()
+    rss_baseline = rss_bytes()
+
+    levels = []
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        print(f"Running {concurrency} concurrent session(s) x {args.questions} question(s)...")
+        levels.append(run_level(concurrency, args.questions, upstream, args.timeout, args.think_ms,
+                                rss_baseline))
+
+    print_report(levels, upstream)
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({
+            "latency_ms": upstream.latency_ms,
+            "jitter": upstream.jitter,
+            "off_topic_rate": upstream.off_topic_rate,
+            "levels": levels,
+        }, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.json_path}")
+
+    if any(r["failures"] or r["abandoned_sessions"] for r in levels):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
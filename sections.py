@@ -0,0 +1,67 @@
+"""
+KEITH Running Floor II - Manual Sections and Topics
+Shared by ingest.py (tagging chunks) and app.py (scoping searches)
+
+Topics mirror the "Topics covered" list in the app sidebar. A chunk is tagged
+with every topic whose keywords appear in its section headings or its text, and
+a question is scoped to every topic whose keywords appear in the question.
+"""
+
+import re
+from typing import Dict, List
+
+# Topic key -> (sidebar label, keywords). Keys are stored in Pinecone metadata,
+# so renaming one requires re-running ingest.py. Keywords are matched as word
+# prefixes, so stems like "prepar" or "leak" also cover "preparing"/"leaking".
+TOPICS: Dict[str, tuple] = {
+    "trailer_prep": ("Trailer preparations", [
+        "trailer prep", "prepar", "crossmember", "cross member",
+        "frame rail", "trailer modif",
+    ]),
+    "drive_unit": ("Drive unit installation", [
+        "drive unit", "drive", "center frame", "frameless", "cylinder", "stroke",
+        "align",
+    ]),
+    "flooring_seals": ("Flooring & seals", [
+        "floor", "slat", "seal", "sub-deck", "subdeck", "bearing",
+    ]),
+    "hydraulics": ("Hydraulic systems", [
+        "hydraulic", "tube", "tubing", "hose", "pump", "valve", "oil", "pressur",
+        "fitting", "filter",
+    ]),
+    "troubleshooting": ("Troubleshooting", [
+        "troubleshoot", "problem", "leak", "nois", "won't", "will not", "not mov",
+        "fault",
+    ]),
+}
+
+# Product names mention "floor" but say nothing about flooring.
+_BRAND_PHRASES = re.compile(r"\b(?:running|walking)\s+floor\b", re.IGNORECASE)
+
+_TOPIC_PATTERNS = {
+    key: re.compile(
+        r"\b(?:" + "|".join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)) + r")\w*",
+        re.IGNORECASE,
+    )
+    for key, (_, keywords) in TOPICS.items()
+}
+
+
+def topic_label(key: str) -> str:
+    """Sidebar label for a topic key."""
+    return TOPICS[key][0]
+
+
+def classify_topics(text: str) -> List[str]:
+    """Return the topic keys whose keywords appear in text, in TOPICS order."""
+    text = _BRAND_PHRASES.sub(" ", text or "")
+    return [key for key, pattern in _TOPIC_PATTERNS.items() if pattern.search(text)]
+
+
+def infer_topics(question: str) -> List[str]:
+    """Guess which topics a question is about (empty list = search everything)."""
+    topics = classify_topics(question)
+    # A question that touches most of the manual is better served unfiltered.
+    if len(topics) > len(TOPICS) // 2:
+        return []
+    return topics